@@ -1,23 +1,39 @@
-﻿import requests
+﻿import os
+import asyncio
+from urllib.parse import quote
+import httpx
 
-api_key = "pat2NtBJgSVD9M7bO.c42c7944b0f2d187ec8ad8200c503ab31c4021fae05603bd860ca1fd8f6c33ff"
-base_id = "appQpDYR8ZukjJnTX"
+api_key = os.getenv("AIRTABLE_API_KEY")
+base_id = os.getenv("AIRTABLE_BASE_ID")
 
-table_names = ["Job Seekers", "Job%20Seekers", "tblOndk2X10XpQLhF"]
+table_names = ["Job Seekers", "tblOndk2X10XpQLhF"]
 
-for table_name in table_names:
-    url = f"https://api.airtable.com/v0/{base_id}/{table_name}?maxRecords=3"
+async def probe(client, table_name):
+    url = f"https://api.airtable.com/v0/{base_id}/{quote(table_name)}?maxRecords=3"
+    return table_name, await client.get(url)
+
+async def main():
     headers = {"Authorization": f"Bearer {api_key}"}
-    print(f"\n--- Testing table name: {table_name} ---")
-    response = requests.get(url, headers=headers)
-    print(f"Status: {response.status_code}")
-    if response.status_code == 200:
-        data = response.json()
-        records = data.get("records", [])
-        print(f"Found {len(records)} records")
-        if records:
-            print(f"Available fields: {list(records[0].get('fields', {}).keys())}")
-            print(f"Sample record: {records[0].get('fields', {})}")
-        break
-    else:
-        print(f"Error: {response.text}")
+    async with httpx.AsyncClient(headers=headers) as client:
+        # Probe all table names at once and keep the first that answers 200
+        tasks = [asyncio.create_task(probe(client, name)) for name in table_names]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                table_name, response = await fut
+                print(f"\n--- Testing table name: {table_name} ---")
+                print(f"Status: {response.status_code}")
+                if response.status_code == 200:
+                    data = response.json()
+                    records = data.get("records", [])
+                    print(f"Found {len(records)} records")
+                    if records:
+                        print(f"Available fields: {list(records[0].get('fields', {}).keys())}")
+                        print(f"Sample record: {records[0].get('fields', {})}")
+                    break
+                else:
+                    print(f"Error: {response.text}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+asyncio.run(main())
@@ -1,32 +1,63 @@
 import os
+import re
+import time
 import asyncio
+import hashlib
+import tempfile
+import queue
+import atexit
 import logging
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import quote, unquote
+from datetime import date, datetime
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-import pandas as pd
-from scraper import run_scraper
+from fastapi.middleware.gzip import GZipMiddleware
+import httpx
+import orjson
+from scraper import AsyncTokenBucket, TTLCache, close_serp_client, open_serp_client, run_scraper
 
-# Logging
+# Logging: handlers only enqueue; a listener thread does the file writes
 os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    filename="logs/app.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+log_queue = queue.SimpleQueue()
+log_file_handler = logging.FileHandler("logs/app.log")
+log_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+log_listener = QueueListener(log_queue, log_file_handler)
+logging.basicConfig(level=logging.INFO, format="%(message)s", handlers=[QueueHandler(log_queue)])
+log_listener.start()
+atexit.register(log_listener.stop)   # flush once at process exit, not per app lifespan
+# httpx logs full request URLs at INFO, and SerpAPI's api_key travels in the query string
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip responses except under skip_prefixes (e.g. .xlsx downloads, already a deflated zip)"""
+
+    def __init__(self, app, skip_prefixes=(), **kwargs):
+        super().__init__(app, **kwargs)
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
 # FastAPI
-app = FastAPI(title="Job Search Assistant", version="3.0.0")
+app = FastAPI(title="Job Search Assistant", version="3.0.0", default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"]
 )
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=512, skip_prefixes=("/export/",))
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
@@ -34,66 +65,354 @@ templates = Jinja2Templates(directory="templates")
 AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
 AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
 AIRTABLE_CLIENTS_TABLE = os.getenv("AIRTABLE_CLIENTS_TABLE", "Job Seekers")
+# Normalise so both "Job Seekers" and a pre-encoded "Job%20Seekers" work
+AIRTABLE_CLIENTS_URL = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{quote(unquote(AIRTABLE_CLIENTS_TABLE))}"
+
+# Shared, pooled Airtable client (created on startup, closed on shutdown)
+airtable_client = None
+
+def open_airtable_client():
+    global airtable_client
+    airtable_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(10.0),
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        headers={"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
+    )
+
+# Airtable allows 5 requests/s per base; every call goes through airtable_request so the
+# bucket caps the request rate (the API's limit), not just how many are in flight
+airtable_bucket = AsyncTokenBucket(300, capacity=5)
+
+async def airtable_request(method, url, **kwargs):
+    await airtable_bucket.acquire()
+    return await airtable_client.request(method, url, **kwargs)
 
 clients_cache = {}
+clients_generation = 0   # bumped whenever clients_cache is replaced
+
+class AirtableCache:
+    """Client-list cache revalidated with ETag/Last-Modified, persisted for warm restarts"""
+
+    def __init__(self, path="cache/airtable_cache.json"):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, "rb") as f:
+                self.entries = orjson.loads(f.read())
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(base_id, table, api_key):
+        key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()
+        return hashlib.sha256(f"{base_id}|{table}|{key_hash}".encode()).hexdigest()[:16]
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def validators(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def set(self, key, records, etag=None, last_modified=None):
+        self.entries[key] = {"etag": etag, "last_modified": last_modified, "records": records}
+        await asyncio.to_thread(self.save, dict(self.entries))
+
+    def save(self, entries):
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Unique temp file per write so overlapping saves cannot clobber each other
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(orjson.dumps(entries))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not persist Airtable cache: {e}")
+            if tmp:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+airtable_cache = AirtableCache()
+
+async def fetch_all_records(url, offset=None, query=None):
+    """Fetch every page of an Airtable table (offsets are chained, so pages are sequential)"""
+    records = []
+    while True:
+        params = {"pageSize": 100, **(query or {})}
+        if offset:
+            params["offset"] = offset
+        res = await airtable_request("GET", url, params=params)
+        res.raise_for_status()
+        page = orjson.loads(res.content)
+        records.extend(page.get("records", []))
+        offset = page.get("offset")
+        if not offset:
+            return records
+
+AIRTABLE_BATCH_SIZE = 10   # Airtable accepts at most 10 records per write
+AIRTABLE_IDS_PER_READ = 50   # keeps filterByFormula well under the URL length limit
+
+def record_id_formula(record_ids):
+    quoted = (rid.replace("\\", "\\\\").replace("'", "\\'") for rid in record_ids)
+    return "OR(" + ",".join(f"RECORD_ID()='{rid}'" for rid in quoted) + ")"
+
+async def fetch_records_by_id(record_ids, url=AIRTABLE_CLIENTS_URL):
+    """Read records via filterByFormula, up to AIRTABLE_IDS_PER_READ ids per request"""
+    records = []
+    for i in range(0, len(record_ids), AIRTABLE_IDS_PER_READ):
+        formula = record_id_formula(record_ids[i:i + AIRTABLE_IDS_PER_READ])
+        records += await fetch_all_records(url, query={"filterByFormula": formula})
+    return records
+
+async def patch_chunk(url, chunk):
+    res = await airtable_request("PATCH", url, json={"records": chunk})
+    res.raise_for_status()
+    return orjson.loads(res.content).get("records", [])
+
+async def batch_patch(records, url=AIRTABLE_CLIENTS_URL):
+    """PATCH [{"id": ..., "fields": {...}}, ...] in 10-record chunks, paced by airtable_bucket.
+
+    Chunks succeed or fail independently, so returns (updated, failed): the records Airtable
+    confirmed, and a (chunk, exception) pair for every chunk that was not written.
+    """
+    chunks = [records[i:i + AIRTABLE_BATCH_SIZE] for i in range(0, len(records), AIRTABLE_BATCH_SIZE)]
+    results = await asyncio.gather(*(patch_chunk(url, chunk) for chunk in chunks), return_exceptions=True)
+    updated, failed = [], []
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, BaseException):
+            failed.append((chunk, result))
+        else:
+            updated.extend(result)
+    return updated, failed
+
+async def fetch_client_records(url):
+    """Revalidate the cached client records (304 reuses them) or re-download every page"""
+    key = AirtableCache.key(AIRTABLE_BASE_ID, AIRTABLE_CLIENTS_TABLE, AIRTABLE_API_KEY)
+    entry = airtable_cache.get(key)
+    res = await airtable_request("GET", url, params={"pageSize": 100}, headers=airtable_cache.validators(entry))
+    if res.status_code == 304 and entry:
+        return entry["records"]
+    res.raise_for_status()
+    page = orjson.loads(res.content)
+    records = page.get("records", [])
+    if page.get("offset"):
+        records += await fetch_all_records(url, page["offset"])
+    await airtable_cache.set(key, records, res.headers.get("ETag"), res.headers.get("Last-Modified"))
+    return records
+
+# Anything outside word chars, space and hyphen is dropped from export filenames
+SAFE_NAME_RE = re.compile(r"[^\w \-]")
+
+@dataclass(slots=True)
+class Client:
+    id: str
+    name: str
+    profession: str
+    safe_name: str   # filename-safe form of name, computed once at load
+    location: str = "New Zealand"   # force NZ
+
+def client_from_record(rec, name):
+    return Client(
+        id=rec["id"], name=name, profession=rec["fields"].get("Profession", ""),
+        safe_name=SAFE_NAME_RE.sub("", name).rstrip().replace(" ", "_")
+    )
 
-def fetch_clients():
+async def test_connection():
+    """Cheap reachability/auth probe: one record, one field, on the pooled client"""
+    try:
+        res = await airtable_request(
+            "GET", AIRTABLE_CLIENTS_URL, params={"maxRecords": 1, "pageSize": 1, "fields[]": "Full Name"}
+        )
+        return res.status_code == 200
+    except httpx.HTTPError as e:
+        logger.error(f"❌ Airtable connection error: {e}")
+        return False
+
+async def fetch_clients():
     """Fetch clients from Airtable"""
-    global clients_cache
+    global clients_cache, clients_generation
     try:
-        url = f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_CLIENTS_TABLE}"
-        headers = {"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
-        res = requests.get(url, headers=headers, timeout=10)
-        res.raise_for_status()
-        data = res.json().get("records", [])
+        data = await fetch_client_records(AIRTABLE_CLIENTS_URL)
         clients_cache = {
-            rec["fields"]["Full Name"]: {
-                "name": rec["fields"].get("Full Name", ""),
-                "profession": rec["fields"].get("Profession", ""),
-                "location": "New Zealand",   # force NZ
-                "id": rec["id"]
-            }
-            for rec in data if "fields" in rec and "Full Name" in rec["fields"]
+            name: client_from_record(rec, name)
+            for rec in data if (name := rec.get("fields", {}).get("Full Name"))
         }
         logger.info(f"✅ Loaded {len(clients_cache)} clients")
     except Exception as e:
         logger.error(f"❌ Airtable fetch error: {e}")
         clients_cache = {}
+    clients_generation += 1
     return clients_cache
 
+# Scrape requests arriving within SCRAPE_BATCH_WINDOW are coalesced into one batch;
+# identical queries in a batch share a single scraper run
+SCRAPE_BATCH_WINDOW = 0.05
+SCRAPE_BATCH_MAX = 8
+scrape_queue = None   # created on startup: the worker's get() binds it to the running loop
+scrape_tasks = set()
+
+async def queue_scrape(query):
+    """Enqueue a query for the batch worker and wait for its jobs"""
+    fut = asyncio.get_running_loop().create_future()
+    await scrape_queue.put((query, fut))
+    return await fut
+
+async def run_scrape_batch(batch):
+    waiters = {}
+    for query, fut in batch:
+        waiters.setdefault(query, []).append(fut)
+    results = await asyncio.gather(*(run_scraper(q) for q in waiters), return_exceptions=True)
+    for futs, result in zip(waiters.values(), results):
+        for fut in futs:
+            if fut.done():
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+async def scrape_worker():
+    while True:
+        batch = [await scrape_queue.get()]
+        await asyncio.sleep(SCRAPE_BATCH_WINDOW)
+        while len(batch) < SCRAPE_BATCH_MAX and not scrape_queue.empty():
+            batch.append(scrape_queue.get_nowait())
+        # Run the batch in its own task so the next window opens immediately
+        task = asyncio.create_task(run_scrape_batch(batch))
+        scrape_tasks.add(task)
+        task.add_done_callback(scrape_tasks.discard)
+
+# Scrape results shared by /search_jobs and /export, keyed by client/profession/date
+SCRAPE_TTL = 600
+scrape_cache = TTLCache(maxsize=1024, ttl=SCRAPE_TTL)
+scrape_locks = {}
+
+def client_query(client_info):
+    return f"{client_info.profession} jobs in New Zealand"
+
+def xray_companies(jobs, limit=8):
+    """First `limit` distinct company names, in result order"""
+    seen = set()
+    companies = []
+    for j in jobs:
+        c = j.get("company")
+        if c and c not in seen:
+            seen.add(c)
+            companies.append(c)
+            if len(companies) >= limit:
+                break
+    return companies
+
+def client_result(client_info, jobs):
+    """Everything the endpoints derive from one scrape: jobs, count, query and X-ray string"""
+    query = client_query(client_info)
+    xray = f'site:linkedin.com/in ("{client_info.profession}") (' + " OR ".join(f'"{c}"' for c in xray_companies(jobs)) + ')'
+    return {"jobs": jobs, "xray": xray, "query": query, "count": len(jobs)}
+
+async def run_for_client(client_info):
+    """Return today's result for a client, scraping at most once per key while fresh"""
+    key = f"{client_info.name}|{client_info.profession}|{date.today()}"
+    result = scrape_cache.get(key)
+    if result is not None:
+        return result
+    lock = scrape_locks.get(key)
+    if lock is None:
+        lock = scrape_locks[key] = asyncio.Lock()
+    async with lock:
+        try:
+            # Another request may have filled the cache while we waited
+            result = scrape_cache.get(key)
+            if result is not None:
+                return result
+            query = client_query(client_info)
+            logger.info(f"🔍 Running scraper for {client_info.name}: {query}")
+            result = client_result(client_info, await queue_scrape(query))
+            scrape_cache.put(key, result)
+            return result
+        finally:
+            # Locks only live while a fill is in progress; waiters keep their own reference
+            if scrape_locks.get(key) is lock:
+                del scrape_locks[key]
+
+# Blocking file/CPU work (Excel export) gets its own small pool so it cannot starve
+# asyncio's default executor; SerpAPI I/O stays on the loop, bounded in scraper.py
+CPU_POOL = None   # created on startup
+
+EXPORT_COLUMNS = ["company", "title", "location", "link", "date"]
+
+def write_jobs_xlsx(path, jobs):
+    """Stream jobs row by row into an .xlsx (constant memory, no DataFrame)"""
+    import xlsxwriter  # deferred: only needed on the first export
+    wb = xlsxwriter.Workbook(path, {"constant_memory": True})
+    ws = wb.add_worksheet()
+    ws.write_row(0, 0, EXPORT_COLUMNS)
+    for r, job in enumerate(jobs, 1):
+        ws.write_row(r, 0, [job.get(k, "") for k in EXPORT_COLUMNS])
+    wb.close()
+
 @app.on_event("startup")
 async def startup_event():
-    fetch_clients()
+    global CPU_POOL, scrape_queue
+    scrape_queue = asyncio.Queue()
+    open_airtable_client()
+    open_serp_client()
+    CPU_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cpu")
+    scrape_tasks.add(asyncio.create_task(scrape_worker()))
+    await fetch_clients()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in list(scrape_tasks):
+        task.cancel()
+    scrape_tasks.clear()
+    await airtable_client.aclose()
+    await close_serp_client()
+    CPU_POOL.shutdown(wait=False)
+
+# Rendered dashboard, reused until the client list or the displayed minute changes
+_dashboard_cache = {"key": None, "html": b"", "etag": ""}
+
+def render_dashboard():
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+    key = (clients_generation, timestamp)
+    if _dashboard_cache["key"] != key:
+        html = templates.get_template("dashboard.html").render(
+            clients=list(clients_cache.values()), timestamp=timestamp
+        ).encode()
+        _dashboard_cache.update(key=key, html=html, etag=hashlib.md5(html).hexdigest())
+    return _dashboard_cache
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "clients": list(clients_cache.values()),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M")
-    })
+    page = render_dashboard()
+    # Weak ETag: GZipMiddleware may re-encode the body, which is still the same page
+    etag = f'W/"{page["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(page["html"], media_type="text/html", headers=headers)
 
 @app.get("/search_jobs")
 async def search_jobs(client: str):
     if client not in clients_cache:
         return JSONResponse({"error": "Client not found"}, status_code=404)
     client_info = clients_cache[client]
-    query = f"{client_info['profession']} jobs in New Zealand"
-    logger.info(f"🔍 Running scraper for {client}: {query}")
     try:
-        jobs = await asyncio.to_thread(run_scraper, query)
+        result = await run_for_client(client_info)
     except Exception as e:
         logger.error(f"Scraper error: {e}")
-        jobs = []
-    # Xray string
-    companies = [j["company"] for j in jobs if j.get("company")]
-    xray = f'site:linkedin.com/in ("{client_info["profession"]}") ("' + '" OR "'.join(companies[:8]) + '")'
+        result = client_result(client_info, [])
     return {
         "client": client,
-        "jobs": jobs,
-        "xray": xray,
-        "query": query,
-        "count": len(jobs),
+        **result,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -101,25 +420,47 @@ async def search_jobs(client: str):
 async def export_jobs(client: str):
     if client not in clients_cache:
         return JSONResponse({"error": "Client not found"}, status_code=404)
-    query = f"{clients_cache[client]['profession']} jobs in New Zealand"
-    jobs = await asyncio.to_thread(run_scraper, query)
+    client_info = clients_cache[client]
+    try:
+        jobs = (await run_for_client(client_info))["jobs"]
+    except Exception as e:
+        logger.error(f"Scraper error: {e}")
+        jobs = []
     if not jobs:
         return JSONResponse({"error": "No jobs to export"}, status_code=404)
-    df = pd.DataFrame(jobs)
-    fname = f"jobs_{client.replace(' ','_')}_{datetime.now().date()}.xlsx"
+    fname = f"jobs_{client_info.safe_name}_{datetime.now().date()}.xlsx"
     path = os.path.join("logs", fname)
-    df.to_excel(path, index=False)
+    await asyncio.get_running_loop().run_in_executor(CPU_POOL, write_jobs_xlsx, path, jobs)
     return FileResponse(path, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", filename=fname)
 
 @app.get("/refresh_clients")
 async def refresh_clients():
-    data = fetch_clients()
+    data = await fetch_clients()
+    scrape_cache.clear()   # an explicit refresh also re-scrapes rather than serving cached jobs
     return {"success": True, "count": len(data)}
 
+# /health is public, so the Airtable probe result is reused briefly instead of spending
+# the per-base request budget on every poll
+HEALTH_TTL = 30
+_health = {"checked_at": float("-inf"), "airtable": False}
+_health_lock = asyncio.Lock()
+
+@app.get("/health")
+async def health():
+    async with _health_lock:
+        if time.monotonic() - _health["checked_at"] >= HEALTH_TTL:
+            _health["airtable"] = await test_connection()
+            _health["checked_at"] = time.monotonic()
+    return {"airtable": _health["airtable"], "clients": len(clients_cache)}
+
+def tail_lines(path, n):
+    """Last n lines of a file, streamed so memory stays flat however large the log grows"""
+    with open(path) as f:
+        return list(deque(f, maxlen=n))
+
 @app.get("/logs")
 async def get_logs():
     try:
-        with open("logs/app.log") as f:
-            return {"logs": f.readlines()[-100:]}
+        return {"logs": await asyncio.to_thread(tail_lines, "logs/app.log", 100)}
     except:
         return {"logs": []}
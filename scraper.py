@@ -1,11 +1,135 @@
-import requests
+import httpx
+import asyncio
+import hashlib
+import logging
+import orjson
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-def run_scraper(query: str):
-    """Fetch jobs from SerpAPI Google Jobs API"""
+# Cap in-flight SerpAPI calls to stay under the provider's rate limit
+SERP_CONCURRENCY = int(os.getenv("SERP_CONCURRENCY", "8"))
+SERP_SEM = asyncio.Semaphore(SERP_CONCURRENCY)
+
+class AsyncTokenBucket:
+    """Token bucket shared by all callers: refills `rate` tokens per minute up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, n=1):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate / 60)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) * 60 / self.rate)
+
+# The semaphore caps calls in flight; the bucket caps calls per minute
+SERP_RPM = float(os.getenv("SERP_RPM", "60"))
+serp_bucket = AsyncTokenBucket(SERP_RPM, capacity=SERP_CONCURRENCY)
+
+class TTLCache:
+    """Size-bounded LRU whose entries are stamped on insert and checked against a TTL on read"""
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+
+    def get(self, key, ttl=None):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        stamp, value = item
+        if time.time() - stamp > (self.ttl if ttl is None else ttl):
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value, stamp=None):
+        self.data[key] = (time.time() if stamp is None else stamp, value)
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+# On-disk response cache keyed by SHA256 of the query params (api_key excluded).
+# SERP_CACHE_MODE: enabled | read_only (never write) | replay (ignore TTL, raise on miss) | disabled
+SERP_CACHE_DIR = os.getenv("SERP_CACHE_DIR", "cache/serp")
+SERP_CACHE_TTL = int(os.getenv("SERP_CACHE_TTL", "3600"))
+SERP_CACHE_MODE = os.getenv("SERP_CACHE_MODE", "enabled")
+
+def cache_key(params):
+    public = {k: v for k, v in params.items() if k != "api_key"}
+    return hashlib.sha256(orjson.dumps(public, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def read_cache(key, ttl):
+    """Return (mtime, data) for a fresh cache file, else None"""
+    path = os.path.join(SERP_CACHE_DIR, f"{key}.json")
+    try:
+        mtime = os.path.getmtime(path)
+        if SERP_CACHE_MODE != "replay" and time.time() - mtime > ttl:
+            return None
+        with open(path, "rb") as f:
+            return mtime, orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def write_cache(key, data):
+    path = os.path.join(SERP_CACHE_DIR, f"{key}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SERP_CACHE_DIR, exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(data))
+        os.replace(tmp, path)  # atomic: readers never see a partial file
+    except OSError as e:
+        # The response was already fetched (and billed); a cache miss next time is fine
+        logger.warning(f"⚠️ Could not write SerpAPI cache: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+# Hot responses stay in memory so repeat queries skip the disk read and JSON parse
+serp_memory = TTLCache(maxsize=1024, ttl=SERP_CACHE_TTL)
+
+# Reused across calls so TCP/TLS handshakes are amortised; HTTP/2 multiplexes concurrent calls.
+# Opened/closed by the app's startup/shutdown hooks so each lifespan gets a live client.
+serp_client = None
+
+def open_serp_client():
+    global serp_client
+    serp_client = httpx.AsyncClient(
+        http2=True,
+        timeout=20,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=16)
+    )
+
+async def close_serp_client():
+    global serp_client
+    if serp_client is not None:
+        await serp_client.aclose()
+        serp_client = None
+
+async def run_scraper(query: str, ttl: int = SERP_CACHE_TTL):
+    """Fetch jobs from SerpAPI Google Jobs API (served from the disk cache when fresh)"""
     url = "https://serpapi.com/search.json"
     params = {
         "engine": "google_jobs",
@@ -14,10 +138,29 @@ def run_scraper(query: str):
         "gl": "nz",  # force New Zealand
         "api_key": GOOGLE_API_KEY
     }
-    res = requests.get(url, params=params, timeout=20)
-    if res.status_code != 200:
-        return []
-    results = res.json().get("jobs_results", [])
+    key = cache_key(params)
+    data = None
+    if SERP_CACHE_MODE != "disabled":
+        data = serp_memory.get(key, ttl) if SERP_CACHE_MODE != "replay" else None
+        if data is None:
+            cached = await asyncio.to_thread(read_cache, key, ttl)
+            if cached:
+                data = cached[1]
+                serp_memory.put(key, data, stamp=cached[0])
+        if data is None and SERP_CACHE_MODE == "replay":
+            raise LookupError(f"No cached SerpAPI response for {query!r} (SERP_CACHE_MODE=replay)")
+    if data is None:
+        async with SERP_SEM:
+            await serp_bucket.acquire()
+            res = await serp_client.get(url, params=params)
+        # Raise rather than return [] so callers never cache a failed scrape as "no jobs"
+        res.raise_for_status()
+        data = orjson.loads(res.content)
+        if SERP_CACHE_MODE == "enabled":
+            serp_memory.put(key, data)
+            await asyncio.to_thread(write_cache, key, data)
+    results = data.get("jobs_results", [])
+    today = datetime.now().strftime("%Y-%m-%d")
     jobs = []
     for r in results:
         jobs.append({
@@ -25,6 +168,6 @@ def run_scraper(query: str):
             "title": r.get("title", ""),
             "location": r.get("location", ""),
             "link": r.get("apply_link", ""),
-            "date": r.get("detected_extensions", {}).get("posted_at", datetime.now().strftime("%Y-%m-%d"))
+            "date": r.get("detected_extensions", {}).get("posted_at", today)
         })
     return jobs